@@ -3,16 +3,149 @@
 PDF Analyzer - Diagnose why a PDF cannot be compressed much
 """
 
+import argparse
 import os
+import re
+from dataclasses import dataclass
 from pathlib import Path
 import pikepdf
 from PIL import Image
 import io
 
+# Optional multi-pattern scanner; falls back to a single compiled regex
+try:
+    import hyperscan
+except ImportError:
+    hyperscan = None
+
+
+# Inputs larger than this (MB) are memory-mapped instead of streamed
+MMAP_THRESHOLD_MB = 100
+
+# Cached PDF names (avoids str() on every object)
+_N_IMAGE, _N_DCT, _N_XO, _N_SUBTYPE, _N_FILTER, _N_RESOURCES = (
+    pikepdf.Name.Image, pikepdf.Name.DCTDecode, pikepdf.Name.XObject,
+    pikepdf.Name.Subtype, pikepdf.Name.Filter, pikepdf.Name.Resources)
+
+FONT_SUBTYPES = (pikepdf.Name.Type1, pikepdf.Name.TrueType, pikepdf.Name.Type0)
+
+# Text detection stops early once a sample is clearly all-text or no-text.
+# The sample is at least TEXT_SAMPLE_MIN_PAGES, growing to TEXT_SAMPLE_FRACTION
+# of the document so long mixed PDFs are not judged by their front matter.
+TEXT_SAMPLE_MIN_PAGES = 20
+TEXT_SAMPLE_FRACTION = 0.1
+TEXT_SAMPLE_HIGH = 0.95
+TEXT_SAMPLE_LOW = 0.05
+
+# Text-showing/positioning operators: Tj, TJ, Td
+TEXT_OPERATORS = (b'Tj', b'TJ', b'Td')
+TEXT_OPERATOR_PATTERN = re.compile(rb'T[jJd]')
+
+if hyperscan is not None:
+    _text_operator_db = hyperscan.Database()
+    _text_operator_db.compile(expressions=list(TEXT_OPERATORS),
+                              ids=list(range(len(TEXT_OPERATORS))),
+                              flags=[0] * len(TEXT_OPERATORS))
+else:
+    _text_operator_db = None
+
+
+def _stop_on_match(*args):
+    """Hyperscan match handler that stops the scan at the first hit."""
+    return True
+
+
+def has_text_operators(content_data):
+    """Check a content stream for text operators in a single pass."""
+    if _text_operator_db is not None:
+        try:
+            _text_operator_db.scan(content_data, match_event_handler=_stop_on_match)
+        except hyperscan.ScanTerminated:
+            return True
+        return False
+    
+    return TEXT_OPERATOR_PATTERN.search(content_data) is not None
+
+
+@dataclass
+class ObjectStats:
+    """Counters collected in a single pass over pdf.objects."""
+    total: int = 0
+    streams: int = 0
+    fonts: int = 0
+    compressed_streams: int = 0
+    images: int = 0
+    jpeg_images: int = 0
+
+
+def _scan_objects(pdf):
+    """Walk pdf.objects once and collect every counter the analyzer needs.
+    
+    Images are counted per page reference, like analyze_images, so soft masks
+    and unreferenced image streams don't skew the JPEG ratio.
+    """
+    stats = ObjectStats(total=len(pdf.objects))
+    
+    for obj in pdf.objects:
+        try:
+            # Type checks instead of attribute probes: no exception per non-dictionary object
+            if isinstance(obj, pikepdf.Stream):
+                stats.streams += 1
+                subtype = obj.stream_dict.get(_N_SUBTYPE)
+                filter_type = obj.stream_dict.get(_N_FILTER)
+                if filter_type is not None:
+                    stats.compressed_streams += 1
+            elif isinstance(obj, pikepdf.Dictionary):
+                subtype = obj.get(_N_SUBTYPE)
+            else:
+                continue
+            
+            if subtype in FONT_SUBTYPES:
+                stats.fonts += 1
+        except:
+            continue
+    
+    # Dictionary lookups only: no stream is read
+    for page in pdf.pages:
+        try:
+            resources = page.get(_N_RESOURCES)
+            xobjects = resources.get(_N_XO) if resources is not None else None
+            if xobjects is None:
+                continue
+            
+            for obj in xobjects.values():
+                if obj.get(_N_SUBTYPE) == _N_IMAGE:
+                    stats.images += 1
+                    if obj.get(_N_FILTER) == _N_DCT:
+                        stats.jpeg_images += 1
+        except:
+            continue
+    
+    return stats
+
+
+def is_single_image_page(page, content_streams):
+    """Check whether a page only paints one image XObject (typical scanned page)."""
+    xobjects = page.get(_N_RESOURCES, {}).get(_N_XO, {})
+    if len(xobjects) != 1:
+        return False
+    
+    image = next(iter(xobjects.values()))
+    if image.get(_N_SUBTYPE) != _N_IMAGE:
+        return False
+    
+    # Stored (compressed) lengths from the stream dictionaries, no inflate
+    content_length = sum(int(stream.get('/Length', 0)) for stream in content_streams)
+    return content_length < 256
+
 
 class PDFAnalyzer:
     """Analyze PDF structure to understand compression potential."""
     
+    def __init__(self, deep=False):
+        # deep: report decoded image sizes (inflates every image stream) instead of stored sizes
+        self.deep = deep
+    
     def analyze_pdf(self, pdf_path):
         """Analyze PDF structure and content."""
         pdf_path = Path(pdf_path)
@@ -27,14 +160,19 @@ class PDFAnalyzer:
         print("=" * 50)
         
         try:
-            with pikepdf.open(pdf_path) as pdf:
+            # Large inputs: let qpdf page in only the objects it touches
+            access_mode = (pikepdf.AccessMode.mmap if file_size_mb > MMAP_THRESHOLD_MB
+                           else pikepdf.AccessMode.default)
+            
+            with pikepdf.open(pdf_path, access_mode=access_mode) as pdf:
                 print(f"📖 Total pages: {len(pdf.pages)}")
                 
                 # Analyze document structure
+                stats = _scan_objects(pdf)
                 self.analyze_document_info(pdf)
-                self.analyze_content_structure(pdf)
+                self.analyze_content_structure(pdf, stats)
                 self.analyze_images(pdf)
-                self.analyze_compression_potential(pdf, file_size_mb)
+                self.analyze_compression_potential(pdf, file_size_mb, stats)
                 
         except Exception as e:
             print(f"❌ Error analyzing PDF: {e}")
@@ -62,28 +200,16 @@ class PDFAnalyzer:
         except:
             print("   ⚠ Could not check XMP metadata")
     
-    def analyze_content_structure(self, pdf):
+    def analyze_content_structure(self, pdf, stats=None):
         """Analyze PDF content structure."""
         print("\n📊 Content Structure:")
         
-        total_objects = len(pdf.objects)
-        print(f"   Total objects: {total_objects}")
-        
-        # Count different object types
-        streams = 0
-        fonts = 0
+        if stats is None:
+            stats = _scan_objects(pdf)
         
-        for obj in pdf.objects:
-            try:
-                if hasattr(obj, 'stream_dict'):
-                    streams += 1
-                if hasattr(obj, 'Subtype') and str(obj.Subtype) in ['/Type1', '/TrueType', '/Type0']:
-                    fonts += 1
-            except:
-                continue
-        
-        print(f"   Content streams: {streams}")
-        print(f"   Fonts: {fonts}")
+        print(f"   Total objects: {stats.total}")
+        print(f"   Content streams: {stats.streams}")
+        print(f"   Fonts: {stats.fonts}")
     
     def analyze_images(self, pdf):
         """Analyze images in the PDF."""
@@ -95,14 +221,14 @@ class PDFAnalyzer:
         
         for page_num, page in enumerate(pdf.pages):
             try:
-                if '/Resources' not in page or '/XObject' not in page['/Resources']:
+                resources = page.get(_N_RESOURCES)
+                xobjects = resources.get(_N_XO) if resources is not None else None
+                if xobjects is None:
                     continue
                 
-                xobjects = page['/Resources']['/XObject']
-                
                 for name, obj in xobjects.items():
                     try:
-                        if hasattr(obj, 'Subtype') and str(obj.Subtype) == '/Image':
+                        if obj.get(_N_SUBTYPE) == _N_IMAGE:
                             total_images += 1
                             
                             # Get image properties
@@ -111,13 +237,16 @@ class PDFAnalyzer:
                             
                             # Get compression info
                             filter_type = "Unknown"
-                            if '/Filter' in obj:
-                                filter_type = str(obj['/Filter'])
+                            filter_obj = obj.get(_N_FILTER)
+                            if filter_obj is not None:
+                                filter_type = str(filter_obj)
                             
-                            # Estimate image data size
+                            # Estimate image data size (stored /Length unless a deep scan was asked for)
                             try:
-                                image_data = obj.read_bytes()
-                                data_size_kb = len(image_data) / 1024
+                                if self.deep:
+                                    data_size_kb = len(obj.read_bytes()) / 1024
+                                else:
+                                    data_size_kb = int(obj.get('/Length', 0)) / 1024
                                 total_image_size += data_size_kb
                                 
                                 image_details.append({
@@ -140,7 +269,8 @@ class PDFAnalyzer:
                 continue
         
         print(f"   Total images found: {total_images}")
-        print(f"   Total image data: {total_image_size:.1f} KB ({total_image_size/1024:.1f} MB)")
+        size_kind = "decoded" if self.deep else "stored"
+        print(f"   Total image data ({size_kind}): {total_image_size:.1f} KB ({total_image_size/1024:.1f} MB)")
         
         if image_details:
             print("   Image breakdown:")
@@ -152,22 +282,16 @@ class PDFAnalyzer:
         else:
             print("   ✓ No images found (text-only PDF)")
     
-    def analyze_compression_potential(self, pdf, file_size_mb):
+    def analyze_compression_potential(self, pdf, file_size_mb, stats=None):
         """Analyze compression potential."""
         print("\n💡 Compression Analysis:")
         
-        # Check if already compressed
-        compressed_streams = 0
-        total_streams = 0
+        if stats is None:
+            stats = _scan_objects(pdf)
         
-        for obj in pdf.objects:
-            try:
-                if hasattr(obj, 'stream_dict'):
-                    total_streams += 1
-                    if '/Filter' in obj.stream_dict:
-                        compressed_streams += 1
-            except:
-                continue
+        # Check if already compressed
+        compressed_streams = stats.compressed_streams
+        total_streams = stats.streams
         
         if total_streams > 0:
             compression_ratio = (compressed_streams / total_streams) * 100
@@ -178,38 +302,46 @@ class PDFAnalyzer:
         
         # Check for text content
         text_indicators = 0
+        pages_seen = 0
+        total_pages = len(pdf.pages)
+        min_sample = max(TEXT_SAMPLE_MIN_PAGES, int(total_pages * TEXT_SAMPLE_FRACTION))
+        
         for page_num, page in enumerate(pdf.pages):
+            # Stop sampling once the verdict is clear either way
+            if pages_seen >= min_sample:
+                text_ratio = text_indicators / pages_seen
+                if text_ratio > TEXT_SAMPLE_HIGH or text_ratio < TEXT_SAMPLE_LOW:
+                    break
+            
+            pages_seen += 1
             try:
                 if '/Contents' in page:
                     content = page['/Contents']
-                    if hasattr(content, 'read_bytes'):
-                        content_data = content.read_bytes()
+                    streams = list(content) if isinstance(content, pikepdf.Array) else [content]
+                    
+                    # Scanned pages: don't inflate a stream that only paints the image
+                    if is_single_image_page(page, streams):
+                        continue
+                    
+                    for stream in streams:
                         # Look for text operators
-                        if b'Tj' in content_data or b'TJ' in content_data or b'Td' in content_data:
+                        if isinstance(stream, pikepdf.Stream) and has_text_operators(stream.read_bytes()):
                             text_indicators += 1
+                            break
             except:
                 continue
         
-        if text_indicators > len(pdf.pages) * 0.7:
-            print("   📝 This PDF is primarily text-based")
+        if pages_seen and text_indicators > pages_seen * 0.7:
+            if pages_seen < total_pages:
+                print(f"   📝 This PDF is primarily text-based (estimated from first {pages_seen} pages)")
+            else:
+                print("   📝 This PDF is primarily text-based")
             print("     → Text PDFs have limited compression potential")
             print("     → Already uses efficient text encoding")
         
         # Check if images are already compressed
-        jpeg_images = 0
-        total_images = 0
-        
-        for page in pdf.pages:
-            try:
-                if '/Resources' in page and '/XObject' in page['/Resources']:
-                    xobjects = page['/Resources']['/XObject']
-                    for name, obj in xobjects.items():
-                        if hasattr(obj, 'Subtype') and str(obj.Subtype) == '/Image':
-                            total_images += 1
-                            if '/Filter' in obj and str(obj['/Filter']) == '/DCTDecode':
-                                jpeg_images += 1
-            except:
-                continue
+        jpeg_images = stats.jpeg_images
+        total_images = stats.images
         
         if total_images > 0:
             jpeg_ratio = (jpeg_images / total_images) * 100
@@ -236,6 +368,11 @@ class PDFAnalyzer:
 
 def main():
     """Main function for PDF analysis."""
+    parser = argparse.ArgumentParser(description="Diagnose why a PDF cannot be compressed much.")
+    parser.add_argument('--deep', action='store_true',
+                        help="report decoded image sizes (slow: inflates every image stream)")
+    args = parser.parse_args()
+    
     print("=== PDF Compression Analyzer ===")
     print("This tool analyzes why your PDF cannot be compressed much.")
     print()
@@ -246,7 +383,7 @@ def main():
             break
         print("❌ File not found. Please try again.")
     
-    analyzer = PDFAnalyzer()
+    analyzer = PDFAnalyzer(deep=args.deep)
     analyzer.analyze_pdf(pdf_path)
     
     print("\n" + "="*50)
@@ -3,24 +3,222 @@
 Quality-Preserving PDF Compressor - Better color and quality handling
 """
 
+import hashlib
+import logging
 import os
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 import pikepdf
-from PIL import Image
+from PIL import Image, ImageChops
 import io
 
+logger = logging.getLogger(__name__)
+
+# Cached PDF names for the per-image hot path (avoids str() on every lookup)
+(_N_IMAGE, _N_FLATE, _N_DCT, _N_XO, _N_SUBTYPE, _N_FILTER, _N_RESOURCES) = (
+    pikepdf.Name.Image, pikepdf.Name.FlateDecode, pikepdf.Name.DCTDecode,
+    pikepdf.Name.XObject, pikepdf.Name.Subtype, pikepdf.Name.Filter,
+    pikepdf.Name.Resources)
+_N_COLORSPACE, _N_DECODE = pikepdf.Name.ColorSpace, pikepdf.Name.Decode
+_N_IMAGE_MASK, _N_MASK = pikepdf.Name.ImageMask, pikepdf.Name.Mask
+_N_BPC = pikepdf.Name.BitsPerComponent
+_JPEG_COLORSPACES = (pikepdf.Name.DeviceRGB, pikepdf.Name.DeviceGray)
+
+# Inputs larger than this (MB) are memory-mapped instead of streamed
+MMAP_THRESHOLD_MB = 100
+
+# Images extracted per worker before a batch is compressed (bounds peak memory
+# while keeping every worker busy)
+JOBS_PER_WORKER = 4
+
+# Optional fast JPEG encoder (libjpeg-turbo); falls back to PIL when missing
+try:
+    import numpy as np
+    from turbojpeg import (TurboJPEG, TJPF_RGB, TJPF_GRAY, TJSAMP_420,
+                           TJSAMP_GRAY, TJFLAG_ACCURATEDCT)
+    _turbojpeg = TurboJPEG()
+except (ImportError, OSError, RuntimeError):
+    _turbojpeg = None
+
+# Optional lossless mozjpeg post-pass for smaller output at the same quality
+try:
+    import mozjpeg_lossless_optimization
+except ImportError:
+    mozjpeg_lossless_optimization = None
+
+
+_encode_state = threading.local()
+
+
+def _encode_jpeg(img, quality):
+    """Encode an 'L' or 'RGB' PIL image to JPEG bytes."""
+    if _turbojpeg is not None:
+        if img.mode == 'L':
+            pixel_format, subsample = TJPF_GRAY, TJSAMP_GRAY
+        else:
+            pixel_format, subsample = TJPF_RGB, TJSAMP_420
+        data = _turbojpeg.encode(np.asarray(img), quality=quality,
+                                 pixel_format=pixel_format,
+                                 jpeg_subsample=subsample,
+                                 flags=TJFLAG_ACCURATEDCT)
+    else:
+        # One encode buffer per thread (and so per pool worker), reused across images
+        output = getattr(_encode_state, 'buffer', None)
+        if output is None:
+            output = _encode_state.buffer = io.BytesIO()
+        output.seek(0)
+        output.truncate()
+        img.save(output, format='JPEG', quality=quality, optimize=True)
+        data = output.getvalue()
+    
+    if mozjpeg_lossless_optimization is not None:
+        data = mozjpeg_lossless_optimization.optimize(data)
+    
+    return data
+
+
+def _jpeg_result(jpeg_bytes):
+    """Read the final size and mode back from encoded JPEG bytes.
+    
+    Returns (jpeg_bytes, width, height, mode).
+    """
+    img = Image.open(io.BytesIO(jpeg_bytes))  # lazy: parses the header only
+    mode = 'L' if img.mode == 'L' else 'RGB'
+    return jpeg_bytes, img.width, img.height, mode
+
+
+def _is_grayscale(img, tolerance=6):
+    """Check whether an RGB image is visually grayscale, from a 64x64 pixel sample."""
+    sample = img.resize((64, 64), Image.Resampling.NEAREST)
+    r, g, b = sample.split()
+    spread = (ImageChops.difference(r, g).getextrema()[1] +
+              ImageChops.difference(g, b).getextrema()[1])
+    return spread < tolerance
+
+
+def _extract_base_image(image_obj):
+    """Extract an image's stored samples, without its /Decode array or masks.
+    
+    The object keeps its /SMask and /Mask entries when rewritten, so viewers
+    still apply them; baking them into the pixels would apply them twice.
+    """
+    pdf_image = pikepdf.PdfImage(image_obj)
+    try:
+        return pdf_image.as_pil_image(apply_decode_array=False, apply_mask=False)
+    except TypeError:
+        # Older pikepdf has no such options and always returns the raw base image
+        return pdf_image.as_pil_image()
+
+
+def _object_key(value):
+    """Hashable identity of a PDF value for exact comparison.
+    
+    Indirect objects (ICC profiles, /Indexed lookup streams, ...) are keyed by
+    objgen, since str() of a stream only shows a prefix of its data.
+    """
+    if isinstance(value, pikepdf.Object) and value.is_indirect:
+        return ('ref', value.objgen)
+    if isinstance(value, pikepdf.Array):
+        return tuple(_object_key(item) for item in value)
+    if isinstance(value, pikepdf.Dictionary):
+        return tuple(sorted((key, _object_key(item)) for key, item in value.items()))
+    if isinstance(value, pikepdf.String):
+        return bytes(value)
+    return str(value)
+
+
+def _get_max_workers():
+    """Number of worker processes to use for image compression."""
+    return os.cpu_count() or 1
+
+
+def _compress_one_image(image_bytes, width, height, colorspace, quality, gray_quality):
+    """Compress raw image pixels to JPEG; takes only picklable inputs.
+    
+    Returns (compressed_bytes, new_width, new_height, mode).
+    """
+    img = Image.frombytes(colorspace, (width, height), image_bytes)
+    compressor = QualityPreservingCompressor(quality=quality, grayscale_quality=gray_quality)
+    return _jpeg_result(compressor.compress_image_smart(img))
+
+
+def _thumbnail_size(width, height, bound=1500):
+    """Size that thumbnail((bound, bound)) produces, keeping the aspect ratio."""
+    scale = min(bound / width, bound / height, 1)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def _recompress_jpeg(jpeg_bytes, quality, gray_quality):
+    """Requantize an existing JPEG stream without a full RGB roundtrip.
+    
+    Returns (compressed_bytes, new_width, new_height, mode).
+    """
+    img = Image.open(io.BytesIO(jpeg_bytes))  # lazy: parses the header only
+    mode = 'L' if img.mode == 'L' else 'RGB'
+    
+    if img.width <= 1500 and img.height <= 1500:
+        if _turbojpeg is not None:
+            # Decode to YCbCr planes and re-encode at the new quality
+            target_quality = gray_quality if mode == 'L' else quality
+            data = _turbojpeg.scale_with_quality(jpeg_bytes, quality=target_quality,
+                                                 flags=TJFLAG_ACCURATEDCT)
+            if mozjpeg_lossless_optimization is not None:
+                data = mozjpeg_lossless_optimization.optimize(data)
+            return data, img.width, img.height, mode
+    else:
+        # Let libjpeg downscale in the DCT domain before the final resize
+        img.draft(mode, _thumbnail_size(img.width, img.height))
+    
+    compressor = QualityPreservingCompressor(quality=quality, grayscale_quality=gray_quality)
+    return _jpeg_result(compressor.compress_image_smart(img))
+
+
+def _run_image_job(job):
+    """Run one (function, args) image job, returning the exception instead of raising."""
+    func, args = job
+    try:
+        return func(*args)
+    except Exception as e:
+        return e
+
 
 class QualityPreservingCompressor:
     """PDF compressor that preserves image quality and colors better."""
     
-    def __init__(self, quality=40, grayscale_quality=50):
+    # PDF colorspace name → (PIL mode, channels) for manual extraction
+    _CS_TABLE = {
+        pikepdf.Name.DeviceRGB: ('RGB', 3),
+        pikepdf.Name.DeviceGray: ('L', 1),
+        pikepdf.Name.DeviceCMYK: ('CMYK', 4),
+    }
+    
+    def __init__(self, quality=40, grayscale_quality=50, min_image_pixels=4096, min_stream_bytes=8192):
         self.quality = quality
         self.grayscale_quality = grayscale_quality
+        self.min_image_pixels = min_image_pixels  # skip icons smaller than this (width × height)
+        self.min_stream_bytes = min_stream_bytes  # skip images stored in fewer bytes than this
+        self._processed = {}  # objgen → image object already queued
+        self._processed_by_content = {}  # content key → first image object with that content
     
     def get_file_size_mb(self, file_path):
         """Get file size in MB."""
         return os.path.getsize(file_path) / (1024 * 1024)
     
+    def _content_key(self, image_obj, raw_data):
+        """Key identifying an image stream's content, or None if it can't be shared."""
+        # Masks live outside the stream, so swapping references could change the result
+        if '/SMask' in image_obj or '/Mask' in image_obj:
+            return None
+        
+        # The whole dictionary, so per-copy entries (/OC layer, /Intent,
+        # /Interpolate, /Metadata, /StructParent) are never merged away
+        digest = hashlib.blake2b(raw_data, digest_size=16).digest()
+        return (digest,) + tuple(sorted(
+            (key, _object_key(value)) for key, value in image_obj.stream_dict.items()
+            if key != '/Length'))
+    
     def smart_image_extraction(self, image_obj):
         """Smart image extraction with multiple fallback methods."""
         try:
@@ -28,56 +226,49 @@ class QualityPreservingCompressor:
             height = int(image_obj.get('/Height', 0))
             colorspace = image_obj.get('/ColorSpace', pikepdf.Name.DeviceRGB)
             
-            print(f"     📐 Dimensions: {width}x{height}")
-            print(f"     🎨 Colorspace: {colorspace}")
+            logger.debug("     📐 Dimensions: %dx%d", width, height)
+            logger.debug("     🎨 Colorspace: %s", colorspace)
             
             # Method 1: Try pikepdf's built-in image extraction first (most reliable)
             try:
-                img = image_obj.as_pil_image()
+                img = _extract_base_image(image_obj)
                 if img:
-                    print(f"     ✅ Built-in extraction successful ({img.mode})")
+                    logger.debug("     ✅ Built-in extraction successful (%s)", img.mode)
                     return img
             except Exception as e:
-                print(f"     ⚠ Built-in extraction failed: {e}")
+                logger.debug("     ⚠ Built-in extraction failed: %s", e)
             
-            # Method 2: Manual extraction as fallback
-            image_data = image_obj.read_bytes()
-            colorspace_str = str(colorspace)
+            # Method 2: Manual extraction as fallback (only now pay for the inflate)
+            image_data = memoryview(image_obj.read_bytes())
             
-            # Determine mode based on colorspace
-            if '/DeviceRGB' in colorspace_str:
-                mode, channels = 'RGB', 3
-            elif '/DeviceGray' in colorspace_str:
-                mode, channels = 'L', 1
-            elif '/DeviceCMYK' in colorspace_str:
-                mode, channels = 'CMYK', 4
-            else:
-                mode, channels = 'RGB', 3  # Default
+            # Determine mode based on colorspace (arrays like [/ICCBased ...] use their family)
+            cs = colorspace[0] if isinstance(colorspace, pikepdf.Array) else colorspace
+            mode, channels = self._CS_TABLE.get(cs, ('RGB', 3))  # Default RGB
             
             expected_size = width * height * channels
             
             if len(image_data) >= expected_size:
                 try:
                     img = Image.frombytes(mode, (width, height), image_data[:expected_size])
-                    print(f"     ✅ Manual extraction successful ({mode})")
+                    logger.debug("     ✅ Manual extraction successful (%s)", mode)
                     return img
                 except Exception as e:
-                    print(f"     ⚠ Manual extraction failed: {e}")
+                    logger.debug("     ⚠ Manual extraction failed: %s", e)
             
             # Method 3: Try RGB as fallback
             if len(image_data) >= width * height * 3:
                 try:
                     img = Image.frombytes('RGB', (width, height), image_data[:width * height * 3])
-                    print(f"     ✅ RGB fallback successful")
+                    logger.debug("     ✅ RGB fallback successful")
                     return img
                 except:
                     pass
             
-            print(f"     ❌ All extraction methods failed")
+            logger.debug("     ❌ All extraction methods failed")
             return None
             
         except Exception as e:
-            print(f"     ❌ Extraction error: {e}")
+            logger.warning("     ❌ Extraction error: %s", e)
             return None
     
     def compress_image_smart(self, img):
@@ -88,117 +279,265 @@ class QualityPreservingCompressor:
         if img.width > 1500 or img.height > 1500:
             original_size = img.size
             img.thumbnail((1500, 1500), Image.Resampling.LANCZOS)
-            print(f"     📏 Resized {original_size} → {img.size}")
+            logger.debug("     📏 Resized %s → %s", original_size, img.size)
         
         # Smart quality and format selection
         if original_mode == 'L':
             # Grayscale images - preserve as grayscale with higher quality
-            print(f"     🖤 Preserving grayscale (Q{self.grayscale_quality})")
-            output = io.BytesIO()
-            img.save(output, format='JPEG', quality=self.grayscale_quality, optimize=True)
-            return output.getvalue()
+            logger.debug("     🖤 Preserving grayscale (Q%d)", self.grayscale_quality)
+            return _encode_jpeg(img, self.grayscale_quality)
             
         elif original_mode in ('RGB', 'CMYK'):
             # Color images
             if original_mode == 'CMYK':
                 img = img.convert('RGB')
-                print(f"     🎨 CMYK → RGB conversion")
+                logger.debug("     🎨 CMYK → RGB conversion")
             
-            print(f"     🌈 Color compression (Q{self.quality})")
-            output = io.BytesIO()
-            img.save(output, format='JPEG', quality=self.quality, optimize=True)
-            return output.getvalue()
+            # Scans are often stored as RGB but carry no colour: drop the chroma channels
+            if _is_grayscale(img):
+                # Never exceed the colour quality: a near-gray image must not
+                # come out larger than it would have as RGB.
+                gray_quality = min(self.quality, self.grayscale_quality)
+                img = img.convert('L')
+                logger.debug("     🖤 Near-grayscale RGB → L (Q%d)", gray_quality)
+                return _encode_jpeg(img, gray_quality)
+            
+            logger.debug("     🌈 Color compression (Q%d)", self.quality)
+            return _encode_jpeg(img, self.quality)
             
         elif original_mode == 'RGBA':
             # Handle transparency by creating white background
             background = Image.new('RGB', img.size, (255, 255, 255))
-            background.paste(img, mask=img.split()[-1])
+            background.paste(img, mask=img.getchannel('A'))  # one plane, not four
             img = background
-            print(f"     🎨 RGBA → RGB (white background)")
+            logger.debug("     🎨 RGBA → RGB (white background)")
             
-            output = io.BytesIO()
-            img.save(output, format='JPEG', quality=self.quality, optimize=True)
-            return output.getvalue()
+            return _encode_jpeg(img, self.quality)
             
         else:
             # Other modes - convert to RGB
             img = img.convert('RGB')
-            print(f"     🎨 {original_mode} → RGB conversion")
+            logger.debug("     🎨 %s → RGB conversion", original_mode)
             
-            output = io.BytesIO()
-            img.save(output, format='JPEG', quality=self.quality, optimize=True)
-            return output.getvalue()
+            return _encode_jpeg(img, self.quality)
     
-    def process_pdf_images(self, pdf):
+    def process_pdf_images(self, pdf, jobs_per_worker=JOBS_PER_WORKER):
         """Process PDF images with quality preservation."""
         images_processed = 0
         total_savings = 0
         
-        for page_num, page in enumerate(pdf.pages):
-            try:
-                if '/Resources' not in page or '/XObject' not in page['/Resources']:
+        self._processed = {}
+        self._processed_by_content = {}
+        
+        max_workers = _get_max_workers()
+        executor = ProcessPoolExecutor(max_workers=max_workers) if max_workers > 1 else None
+        batch_size = max_workers * jobs_per_worker
+        last_page = len(pdf.pages) - 1
+        pending, jobs = [], []
+        
+        try:
+            # Batch by image count, not pages, so only one batch's pixel buffers are
+            # alive at once and a one-image-per-page scan still fills the pool
+            for page_num, page in enumerate(pdf.pages):
+                # Pass 1: extract images on the main process (pikepdf is not fork-safe)
+                page_pending, page_jobs = self._collect_image_jobs([page], page_num)
+                pending.extend(page_pending)
+                jobs.extend(page_jobs)
+                if len(jobs) < batch_size and page_num < last_page:
                     continue
                 
-                xobjects = page['/Resources']['/XObject']
+                # Pass 2: compress in parallel across worker processes
+                results = self._compress_images_parallel(jobs, executor)
+                
+                # Pass 3: write results back on the main process
+                processed, savings = self._write_compressed_images(pending, results)
+                images_processed += processed
+                total_savings += savings
+                pending, jobs = [], []
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        
+        logger.info("   ✅ Processed %d images", images_processed)
+        logger.info("   💾 Total image savings: %d KB (%.1f MB)", total_savings, total_savings / 1024)
+        
+        return images_processed
+    
+    def _collect_image_jobs(self, pages, first_page_num):
+        """Extract compressible images from pages into picklable worker jobs.
+        
+        Returns (pending, jobs): pending[i] is (page_num, name, obj, original_len)
+        for jobs[i].
+        """
+        pending = []
+        jobs = []
+        
+        for page_num, page in enumerate(pages, start=first_page_num):
+            try:
+                resources = page.get(_N_RESOURCES)
+                xobjects = resources.get(_N_XO) if resources is not None else None
+                if xobjects is None:
+                    continue
                 
                 for name, obj in list(xobjects.items()):
                     try:
-                        if (hasattr(obj, 'Subtype') and 
-                            str(obj.Subtype) == '/Image' and
-                            '/Filter' in obj and
-                            str(obj['/Filter']) == '/FlateDecode'):
-                            
-                            print(f"   🖼️ Processing image on page {page_num + 1}...")
+                        if obj.get(_N_SUBTYPE) != _N_IMAGE:
+                            continue
+                        
+                        filter_type = obj.get(_N_FILTER)
+                        is_flate = filter_type == _N_FLATE
+                        is_jpeg = (filter_type == _N_DCT and
+                                   obj.get(_N_COLORSPACE) in _JPEG_COLORSPACES)
+                        
+                        if not (is_flate or is_jpeg):
+                            continue
+                        
+                        # Stencil masks, /Decode arrays and colour-key masks are tied to the
+                        # exact stored samples and colorspace, which JPEG re-encoding changes
+                        if (obj.get(_N_IMAGE_MASK, False) or _N_DECODE in obj or
+                                isinstance(obj.get(_N_MASK), pikepdf.Array)):
+                            continue
+                        
+                        # JPEG is 8 bits per sample: 16-bit images come back as I;16, which
+                        # Pillow clips rather than scales, and 1-bit art only grows as JPEG
+                        if is_flate and int(obj.get(_N_BPC, 8)) != 8:
+                            continue
+                        
+                        # Tiny images: decoding costs more than recompressing could save
+                        width = int(obj.get('/Width', 0))
+                        height = int(obj.get('/Height', 0))
+                        stored_len = obj.get('/Length')
+                        if (width * height < self.min_image_pixels or
+                                (stored_len is not None and int(stored_len) < self.min_stream_bytes)):
+                            logger.debug("   ⏭️ Page %d: skipping small image %s (%dx%d)",
+                                         page_num + 1, name, width, height)
+                            continue
+                        
+                        # Shared XObjects are rewritten in place, so every reference sees the result
+                        if obj.objgen in self._processed:
+                            continue
+                        
+                        # Identical images stored as separate objects: point at the first copy
+                        raw_data = obj.read_raw_bytes()
+                        content_key = self._content_key(obj, raw_data)
+                        duplicate = self._processed_by_content.get(content_key)
+                        if duplicate is not None:
+                            xobjects[name] = duplicate
+                            logger.info("   ♻️ Page %d: reusing identical image for %s", page_num + 1, name)
+                            continue
+                        
+                        self._processed[obj.objgen] = obj
+                        if content_key is not None:
+                            self._processed_by_content[content_key] = obj
+                        
+                        if is_flate:
+                            logger.info("   🖼️ Processing image on page %d...", page_num + 1)
                             
-                            # Get original size
-                            original_data = obj.read_bytes()
-                            original_size_kb = len(original_data) // 1024
+                            # Stored (compressed) size, no inflate
+                            raw_len = len(raw_data)
+                            del raw_data
                             
                             # Extract image
                             img = self.smart_image_extraction(obj)
                             
                             if img:
-                                # Compress with quality preservation
-                                compressed_data = self.compress_image_smart(img)
-                                compressed_size_kb = len(compressed_data) // 1024
-                                
-                                # Only replace if compression is significant
-                                compression_ratio = (1 - len(compressed_data) / len(original_data)) * 100
-                                
-                                if compression_ratio > 10:  # Only if >10% savings
-                                    # Update the PDF object
-                                    obj.write(compressed_data, filter=pikepdf.Name.DCTDecode)
-                                    obj['/Width'] = img.width
-                                    obj['/Height'] = img.height
-                                    obj['/BitsPerComponent'] = 8
-                                    
-                                    # Set appropriate colorspace
-                                    if img.mode == 'L':
-                                        obj['/ColorSpace'] = pikepdf.Name.DeviceGray
-                                    else:
-                                        obj['/ColorSpace'] = pikepdf.Name.DeviceRGB
-                                    
-                                    savings_kb = original_size_kb - compressed_size_kb
-                                    total_savings += savings_kb
-                                    images_processed += 1
-                                    
-                                    print(f"     💾 {original_size_kb} KB → {compressed_size_kb} KB ({compression_ratio:.1f}% reduction)")
-                                else:
-                                    print(f"     ⏭️ Skipped (only {compression_ratio:.1f}% savings)")
+                                # Palette and other exotic modes don't survive tobytes()
+                                if img.mode not in ('L', 'RGB', 'CMYK', 'RGBA'):
+                                    img = img.convert('RGB')
+                                pending.append((page_num, name, obj, raw_len))
+                                jobs.append((_compress_one_image,
+                                             (img.tobytes(), img.width, img.height, img.mode,
+                                              self.quality, self.grayscale_quality)))
                             else:
-                                print(f"     ❌ Could not extract image")
+                                logger.warning("     ❌ Could not extract image")
+                        
+                        else:
+                            # Already JPEG: hand the raw stream over without decoding it here
+                            logger.info("   🖼️ Requantizing JPEG image on page %d...", page_num + 1)
+                            pending.append((page_num, name, obj, len(raw_data)))
+                            jobs.append((_recompress_jpeg,
+                                         (raw_data, self.quality, self.grayscale_quality)))
                                 
                     except Exception as e:
-                        print(f"     ⚠ Error processing image: {e}")
+                        logger.warning("     ⚠ Error processing image: %s", e)
                         continue
                         
             except Exception as e:
                 continue
         
-        print(f"   ✅ Processed {images_processed} images")
-        print(f"   💾 Total image savings: {total_savings} KB ({total_savings/1024:.1f} MB)")
+        return pending, jobs
+    
+    def _write_compressed_images(self, pending, results):
+        """Write worker results back into the PDF; returns (images_processed, savings_kb)."""
+        images_processed = 0
+        total_savings = 0
         
-        return images_processed
+        updates = []
+        
+        for (page_num, name, obj, original_len), result in zip(pending, results):
+            try:
+                if isinstance(result, Exception):
+                    logger.warning("     ⚠ Error compressing image %s on page %d: %s", name, page_num + 1, result)
+                    continue
+                
+                compressed_data, width, height, mode = result
+                
+                # Only replace if compression is significant
+                compression_ratio = (1 - len(compressed_data) / original_len) * 100
+                
+                if compression_ratio > 10:  # Only if >10% savings
+                    # Set appropriate colorspace
+                    if mode == 'L':
+                        colorspace = pikepdf.Name.DeviceGray
+                    else:
+                        colorspace = pikepdf.Name.DeviceRGB
+                    
+                    updates.append((page_num, obj, original_len, compressed_data, {
+                        '/Width': width,
+                        '/Height': height,
+                        '/BitsPerComponent': 8,
+                        '/ColorSpace': colorspace,
+                    }))
+                else:
+                    logger.info("   ⏭️ Page %d: skipped (only %.1f%% savings)", page_num + 1, compression_ratio)
+                    
+            except Exception as e:
+                logger.warning("     ⚠ Error processing image: %s", e)
+                continue
+        
+        # Update the PDF objects in one sweep once the whole chunk is decided
+        for page_num, obj, original_len, compressed_data, updates_dict in updates:
+            try:
+                obj.write(compressed_data, filter=_N_DCT)
+                for key, value in updates_dict.items():
+                    obj[key] = value
+                
+                original_size_kb = original_len // 1024
+                compressed_size_kb = len(compressed_data) // 1024
+                compression_ratio = (1 - len(compressed_data) / original_len) * 100
+                
+                savings_kb = original_size_kb - compressed_size_kb
+                total_savings += savings_kb
+                images_processed += 1
+                
+                logger.info("   💾 Page %d: %d KB → %d KB (%.1f%% reduction)",
+                            page_num + 1, original_size_kb, compressed_size_kb, compression_ratio)
+            except Exception as e:
+                logger.warning("     ⚠ Error processing image: %s", e)
+                continue
+        
+        return images_processed, total_savings
+    
+    def _compress_images_parallel(self, jobs, executor=None):
+        """Compress extracted images across a process pool, in job order."""
+        if executor is not None and len(jobs) > 1:
+            try:
+                # One job per task: image sizes vary too much for static chunking
+                return list(executor.map(_run_image_job, jobs))
+            except Exception as e:
+                logger.warning("   ⚠ Parallel compression unavailable (%s), falling back to serial", e)
+        
+        return [_run_image_job(job) for job in jobs]
     
     def compress_pdf_quality(self, input_path, output_path=None):
         """Compress PDF with quality preservation."""
@@ -215,16 +554,20 @@ class QualityPreservingCompressor:
         original_size = self.get_file_size_mb(input_path)
         
         try:
-            print(f"📄 Processing: {input_path.name}")
-            print(f"📏 Original size: {original_size:.2f} MB")
-            print(f"🎛️ Color quality: {self.quality}, Grayscale quality: {self.grayscale_quality}")
-            print()
+            logger.info("📄 Processing: %s", input_path.name)
+            logger.info("📏 Original size: %.2f MB", original_size)
+            logger.info("🎛️ Color quality: %d, Grayscale quality: %d", self.quality, self.grayscale_quality)
+            logger.info("")
+            
+            # Large inputs: let qpdf page in only the objects it touches
+            access_mode = (pikepdf.AccessMode.mmap if original_size > MMAP_THRESHOLD_MB
+                           else pikepdf.AccessMode.default)
             
-            with pikepdf.open(input_path) as pdf:
-                print("🔄 Processing images with quality preservation...")
+            with pikepdf.open(input_path, access_mode=access_mode) as pdf:
+                logger.info("🔄 Processing images with quality preservation...")
                 images_processed = self.process_pdf_images(pdf)
                 
-                print("\n🧹 Cleaning metadata...")
+                logger.info("\n🧹 Cleaning metadata...")
                 try:
                     if pdf.docinfo:
                         for key in list(pdf.docinfo.keys()):
@@ -232,33 +575,49 @@ class QualityPreservingCompressor:
                                 del pdf.docinfo[key]
                             except:
                                 pass
-                    print("   ✅ Metadata cleaned")
+                    logger.info("   ✅ Metadata cleaned")
                 except Exception as e:
-                    print(f"   ⚠ Warning: {e}")
+                    logger.warning("   ⚠ Warning: %s", e)
                 
-                print("\n💾 Saving optimized PDF...")
-                pdf.save(output_path, compress_streams=True)
+                logger.info("\n💾 Saving optimized PDF...")
+                # Pack small objects into object streams; untouched streams are
+                # copied as-is (re-deflating would drop their PNG predictors)
+                pdf.save(output_path,
+                         compress_streams=True,
+                         object_stream_mode=pikepdf.ObjectStreamMode.generate,
+                         deterministic_id=False)
             
             new_size = self.get_file_size_mb(output_path)
             compression_ratio = (1 - new_size / original_size) * 100 if original_size > 0 else 0
             savings_mb = original_size - new_size
             
-            print("="*60)
-            print("📊 Compression Results:")
-            print(f"   Original: {original_size:.2f} MB")
-            print(f"   New size: {new_size:.2f} MB")
-            print(f"   Saved: {savings_mb:.2f} MB ({compression_ratio:.1f}% reduction)")
+            logger.info("="*60)
+            logger.info("📊 Compression Results:")
+            logger.info("   Original: %.2f MB", original_size)
+            logger.info("   New size: %.2f MB", new_size)
+            logger.info("   Saved: %.2f MB (%.1f%% reduction)", savings_mb, compression_ratio)
             
             return True, str(output_path), original_size, new_size, None
             
         except Exception as e:
             error_msg = f"Error: {str(e)}"
-            print(f"❌ {error_msg}")
+            logger.error("❌ %s", error_msg)
             return False, None, original_size, 0, error_msg
 
 
+class _BufferedStreamHandler(logging.StreamHandler):
+    """StreamHandler that leaves flushing to the stream's own buffering."""
+    
+    def flush(self):
+        pass
+
+
 def main():
     """Main function with quality-focused options."""
+    # Share sys.stdout with print() so output stays in order, without a flush per record
+    logging.basicConfig(level=logging.INFO, format='%(message)s',
+                        handlers=[_BufferedStreamHandler(sys.stdout)])
+    
     print("=== Quality-Preserving PDF Compressor ===")
     print("Better color handling and quality preservation!")
     print()